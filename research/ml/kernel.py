@@ -12,6 +12,40 @@ class Kernel:
     def transform(self, xi, xj):
         raise NotImplementedError()
 
+    def gram(self, X1, X2):
+        """Computes the kernel matrix between the rows of X1 and X2.
+
+        Default implementation calls transform() on every pair of rows, or
+        only on the upper triangle if X1 and X2 are the same array, since
+        kernels are symmetric. Subclasses override this with a batched
+        computation.
+
+        Parameters
+        ----------
+        X1 : np.ndarray, shape(n1, m)
+            Input.
+        X2 : np.ndarray, shape(n2, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray, shape(n1, n2)
+            Kernel matrix, where K[i, j] = transform(X1[i], X2[j]).
+        """
+        # Bind once so the pair loops don't repeat the method lookup
+        transform = self.transform
+
+        if X1 is X2:
+            n = len(X1)
+            K = np.empty((n, n))
+            for i in range(n):
+                xi = X1[i]
+                for j in range(i, n):
+                    K[i, j] = K[j, i] = transform(xi, X1[j])
+            return K
+
+        return np.array([[transform(xi, xj) for xj in X2] for xi in X1])
+
 
 class GaussianKernel(Kernel):
     """Gaussian kernel: exp[-||xi-xj||**2 / radius**2)]
@@ -29,14 +63,31 @@ class GaussianKernel(Kernel):
         flexible classifiers, at the risk of overfitting. Large radius values
         gradually reduce the kernel to a continuous function, thereby limitting
         the ability of the kernel to fit complex boundaries.
+    n_components : int, default None
+        If set, gram() approximates the kernel with this many random Fourier
+        features (see feature_map()). Keeps the cost of evaluating a trained
+        SVM independent of the number of support vectors.
+
+    Attributes
+    ----------
+    W_ : np.ndarray, shape(n_components, m)
+        Random Fourier feature frequencies. Drawn on first call to
+        feature_map().
+    b_ : np.array, shape(n_components)
+        Random Fourier feature phases. Drawn on first call to feature_map().
     """
 
-    def __init__(self, pairwise, radius=.5):
+    def __init__(self, pairwise, radius=.5, n_components=None):
         if radius <= 0:
             raise ValueError('radius must be greater than zero.')
+        if n_components is not None and n_components <= 0:
+            raise ValueError('n_components must be greater than zero.')
         self.pairwise = pairwise
         self.radius = radius
+        self.n_components = n_components
         self.name = 'gaussian'
+        self.W_ = None
+        self.b_ = None
 
     def transform(self, xi, xj, return_similarity=False):
         """Computes Gaussian distance.
@@ -67,6 +118,62 @@ class GaussianKernel(Kernel):
             norm = np.linalg.norm(xi-xj)
             return np.exp(-norm**2 / self.radius**2)
 
+    def gram(self, X1, X2):
+        """Computes Gaussian kernel matrix between the rows of X1 and X2.
+
+        Uses the same formula as the non-pairwise transform(). Squared
+        distances are expanded as ||xi||**2 + ||xj||**2 - 2*<xi,xj> so the
+        whole matrix is built from one matrix product.
+
+        Parameters
+        ----------
+        X1 : np.ndarray, shape(n1, m)
+            Input.
+        X2 : np.ndarray, shape(n2, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray, shape(n1, n2)
+            Kernel matrix.
+        """
+        if self.n_components is not None:
+            Phi1 = self.feature_map(X1)
+            Phi2 = Phi1 if X1 is X2 else self.feature_map(X2)
+            return Phi1.dot(Phi2.T)
+
+        sqnorm1 = np.sum(X1**2, 1)
+        sqnorm2 = sqnorm1 if X1 is X2 else np.sum(X2**2, 1)
+        sqdist = sqnorm1.reshape(-1, 1) + sqnorm2 - 2*X1.dot(X2.T)
+        # Rounding can make distances between close points slightly negative
+        np.maximum(sqdist, 0, out=sqdist)
+        return np.exp(-sqdist / self.radius**2)
+
+    def feature_map(self, X):
+        """Maps inputs to random Fourier features.
+
+        Features are sqrt(2/D)*cos(W*x + b), with W drawn from
+        N(0, 2/radius**2) and b from U[0, 2*pi], so that
+        feature_map(xi).dot(feature_map(xj)) approximates
+        exp(-||xi-xj||**2 / radius**2). W and b are drawn on the first call
+        and reused afterwards.
+
+        Parameters
+        ----------
+        X : np.ndarray, shape(n, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray, shape(n, n_components)
+            Random Fourier features.
+        """
+        D = self.n_components
+        if self.W_ is None:
+            self.W_ = np.sqrt(2) * np.random.randn(D, X.shape[1]) / self.radius
+            self.b_ = 2 * np.pi * np.random.rand(D)
+        return np.sqrt(2 / D) * np.cos(X.dot(self.W_.T) + self.b_)
+
 
 class LinearKernel(Kernel):
     """Linear kernel: <xi,xj>"""
@@ -93,6 +200,23 @@ class LinearKernel(Kernel):
         """
         return xi.dot(xj)
 
+    def gram(self, X1, X2):
+        """Computes dot products between the rows of X1 and X2.
+
+        Parameters
+        ----------
+        X1 : np.ndarray, shape(n1, m)
+            Input.
+        X2 : np.ndarray, shape(n2, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray, shape(n1, n2)
+            Kernel matrix.
+        """
+        return X1.dot(X2.T)
+
 
 class PolynomialKernel(Kernel):
     """Polynomial kernel: (1 + <xi,xj>)**d.
@@ -125,6 +249,23 @@ class PolynomialKernel(Kernel):
         """
         return (1+xi.dot(xj))**self.degree
 
+    def gram(self, X1, X2):
+        """Computes polynomial kernel matrix between the rows of X1 and X2.
+
+        Parameters
+        ----------
+        X1 : np.ndarray, shape(n1, m)
+            Input.
+        X2 : np.ndarray, shape(n2, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray, shape(n1, n2)
+            Kernel matrix.
+        """
+        return (1+X1.dot(X2.T))**self.degree
+
 
 class SigmoidKernel(Kernel):
     """Sigmoid kernel: 1 / (1 + np.exp(-A))"""
@@ -149,6 +290,23 @@ class SigmoidKernel(Kernel):
         """
         return 1 / (1 + np.exp(-xi.dot(xj)))
 
+    def gram(self, X1, X2):
+        """Computes Sigmoid kernel matrix between the rows of X1 and X2.
+
+        Parameters
+        ----------
+        X1 : np.ndarray, shape(n1, m)
+            Input.
+        X2 : np.ndarray, shape(n2, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray, shape(n1, n2)
+            Kernel matrix.
+        """
+        return 1 / (1 + np.exp(-X1.dot(X2.T)))
+
 
 class TanHKernel(Kernel):
     """Hyperbolic Tangent kernel: tanh(xi*xj)"""
@@ -173,6 +331,23 @@ class TanHKernel(Kernel):
         """
         return np.tanh(xi.dot(xj))
 
+    def gram(self, X1, X2):
+        """Computes TanH kernel matrix between the rows of X1 and X2.
+
+        Parameters
+        ----------
+        X1 : np.ndarray, shape(n1, m)
+            Input.
+        X2 : np.ndarray, shape(n2, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray, shape(n1, n2)
+            Kernel matrix.
+        """
+        return np.tanh(X1.dot(X2.T))
+
 
 KERNEL_MAP = {
     'gaussian': GaussianKernel,
@@ -1,5 +1,133 @@
 import numpy as np
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# All fast-math flags except 'nnan' and 'ninf', since clip_thresh defaults to
+# np.inf.
+_FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+
+def _momentum_update(v, w, grad, lr, mu, reg, clip_thresh):
+    """Fused momentum update over flattened arrays.
+
+    Clips each gradient, adjusts it with regularization, and updates the
+    momentum in place: v = mu*v + lr*(clip(grad) - reg*w).
+
+    Parameters
+    ----------
+    v : np.array
+        Momentums. Updated in place.
+    w : np.array
+        Weights or biases.
+    grad : np.array
+        Gradients.
+    lr : numeric
+        Learning rate.
+    mu : float
+        Momentum parameter.
+    reg : float
+        Regularization parameter.
+    clip_thresh : float
+        Maximum gradient allowed.
+
+    Returns
+    -------
+    float
+        Max absolute clipped gradient.
+    """
+    grad_max = 0.
+    for j in numba.prange(v.shape[0]):
+        g = min(max(grad[j], -clip_thresh), clip_thresh)
+        grad_max = max(grad_max, abs(g))
+        v[j] = mu*v[j] + lr*(g - reg*w[j])
+    return grad_max
+
+
+def _adagrad_update(c, grad, update, lr, epsilon):
+    """Fused AdaGrad update over flattened arrays.
+
+    Updates the cache in place, c = c + grad**2, and writes
+    lr*grad/sqrt(c + epsilon) into update.
+
+    Parameters
+    ----------
+    c : np.array
+        Cache. Updated in place.
+    grad : np.array
+        Gradients.
+    update : np.array
+        Output array for the weight/bias updates.
+    lr : numeric
+        Learning rate.
+    epsilon : numeric
+        Parameter to make cache update denomenator nonzero.
+
+    Returns
+    -------
+    float
+        Max absolute gradient.
+    """
+    grad_max = 0.
+    for j in numba.prange(c.shape[0]):
+        g = grad[j]
+        grad_max = max(grad_max, abs(g))
+        c[j] += g*g
+        update[j] = lr*g / np.sqrt(c[j] + epsilon)
+    return grad_max
+
+
+def _layer_buffers(M, dtype):
+    """Allocates zeroed per-layer weight and bias buffers.
+
+    All layers' weights share one contiguous array, as do all layers' biases,
+    and each layer gets a view into it. Keeps optimizer state for the whole
+    network in two regions of memory instead of one array per layer.
+
+    Parameters
+    ----------
+    M : list
+        Layer sizes, including input dimension and number of output classes.
+    dtype : np.dtype
+        Data type of the buffers.
+
+    Returns
+    -------
+    tuple
+        np.array
+            Flat weight buffer.
+        list
+            Views of shape (M[i], M[i+1]) into the flat weight buffer.
+        np.array
+            Flat bias buffer.
+        list
+            Views of shape (M[i+1]) into the flat bias buffer.
+    """
+    W_shapes = [(M[i], M[i+1]) for i in range(len(M)-1)]
+    W_sizes = [m*n for m, n in W_shapes]
+    W_offsets = np.cumsum([0] + W_sizes)
+    b_offsets = np.cumsum([0] + M[1:])
+    W_flat = np.zeros(W_offsets[-1], dtype=dtype)
+    b_flat = np.zeros(b_offsets[-1], dtype=dtype)
+    W_views = [W_flat[W_offsets[i]:W_offsets[i+1]].reshape(W_shapes[i])
+               for i in range(len(W_shapes))]
+    b_views = [b_flat[b_offsets[i]:b_offsets[i+1]]
+               for i in range(len(W_shapes))]
+    return W_flat, W_views, b_flat, b_views
+
+
+if numba is not None:
+    _jit = numba.njit(parallel=True, fastmath=_FASTMATH, cache=True)
+    _momentum_update = _jit(_momentum_update)
+    _adagrad_update = _jit(_adagrad_update)
+else:
+    # The pure Python loops would be far slower than NumPy, so optimizers
+    # fall back to their NumPy updates.
+    _momentum_update = None
+    _adagrad_update = None
+
 
 class Optimizer:
     """Abstract class. Strategy for updating weights and biases of MLP."""
@@ -35,27 +163,33 @@ class MomentumOptimizer(Optimizer):
     clip_thresh : float, default np.inf
        Maximum weight/bias gradient allowed. If gradient is larger than
        clip_thresh, the gradient is replaced with clip_thresh.
+    dtype : np.dtype, default np.float32
+        Data type of the momentums. Updates are memory bound, so float32
+        halves their cost compared to float64. MLP weights should use the
+        same dtype; mixed dtypes work but lose most of the benefit.
 
     Attributes
     ----------
     vW_ : list, shape (len(M)+1)
-        List of weight momentums. Same shapes as MLP's matrices in W.
+        List of weight momentums. Same shapes as MLP's matrices in W. Views
+        into one contiguous buffer.
     vb_ : list, shape (len(M)+1)
-        List of bias momentums. Same shapes as MLP's bias vectors.
+        List of bias momentums. Same shapes as MLP's bias vectors. Views into
+        one contiguous buffer.
     """
 
     def __init__(self, D, K, hidden_layer_sizes, lr, mu=0, reg=0,
-                 clip_thresh=np.inf):
-        self.lr = lr
-        self.mu = mu
-        self.reg = reg
+                 clip_thresh=np.inf, dtype=np.float32):
+        dtype = np.dtype(dtype)
+        self.dtype = dtype
+        # Keep scalars in dtype so they don't upcast the updates
+        self.lr = dtype.type(lr)
+        self.mu = dtype.type(mu)
+        self.reg = dtype.type(reg)
         self.clip_thresh = clip_thresh
-        self.vW_ = [None for i in range(len(hidden_layer_sizes)+1)]
-        self.vb_ = [None for i in range(len(hidden_layer_sizes)+1)]
         M = [D] + hidden_layer_sizes + [K]
-        for i in range(len(hidden_layer_sizes)+1):
-            self.vW_[i] = np.zeros((M[i], M[i+1]))
-            self.vb_[i] = np.zeros((M[i+1]))
+        self._vW_flat, self.vW_, self._vb_flat, self.vb_ = _layer_buffers(
+            M, dtype)
 
     def layer_update(self, mlp, i, dJdW_i, dJdb_i, grad_max):
         """Returns weight+bias updates for a single layer, i.
@@ -90,26 +224,38 @@ class MomentumOptimizer(Optimizer):
         W_i = mlp.W[i]
         b_i = mlp.b[i]
 
+        if _momentum_update is not None:
+            # Momentums are contiguous, so reshape(-1) returns views.
+            _grad_max = _momentum_update(
+                self.vW_[i].reshape(-1), W_i.reshape(-1), dJdW_i.reshape(-1),
+                lr, mu, reg, clip_thresh)
+            _momentum_update(self.vb_[i], b_i, dJdb_i, lr, mu, reg,
+                             clip_thresh)
+            return self.vW_[i], self.vb_[i], max(grad_max, _grad_max)
+
         # Clip gradients that are too large
-        dJdW_i[dJdW_i > clip_thresh] = clip_thresh
-        dJdW_i[dJdW_i < -1*clip_thresh] = -1*clip_thresh
-        dJdb_i[dJdb_i > clip_thresh] = clip_thresh
-        dJdb_i[dJdb_i < -1*clip_thresh] = -1*clip_thresh
+        np.clip(dJdW_i, -clip_thresh, clip_thresh, out=dJdW_i)
+        np.clip(dJdb_i, -clip_thresh, clip_thresh, out=dJdb_i)
 
         # Compute max gradient update (for debugging)
-        grad_max = max((grad_max, max(dJdW_i.max(), dJdW_i.min(),
-                                      key=abs)))
-
-        # Adjust gradients with regularization
-        dJdW_i = dJdW_i - reg*W_i
-        dJdb_i = dJdb_i - reg*b_i
-
-        # Update momentums (velocities)
-        self.vW_[i] = mu*self.vW_[i] + lr*dJdW_i
-        self.vb_[i] = mu*self.vb_[i] + lr*dJdb_i
-
+        grad_max = max(grad_max, np.abs(dJdW_i).max())
+
+        # Adjust gradients with regularization and scale by learning rate.
+        # Gradients were already clipped in place, so they're reused as
+        # scratch space.
+        if reg:
+            dJdW_i -= reg*W_i
+            dJdb_i -= reg*b_i
+        dJdW_i *= lr
+        dJdb_i *= lr
+
+        # Update momentums (velocities) in place
         w_update = self.vW_[i]
         b_update = self.vb_[i]
+        w_update *= mu
+        w_update += dJdW_i
+        b_update *= mu
+        b_update += dJdb_i
 
         return w_update, b_update, grad_max
 
@@ -137,17 +283,34 @@ class AdaGradOptimizer(Optimizer):
         Learning rate.
     epsilon : numeric, default=1e-8
         Parameter to make cache update denomenator nonzero.
+    dtype : np.dtype, default np.float32
+        Data type of the caches and updates. Updates are memory bound, so
+        float32 halves their cost compared to float64. MLP weights should use
+        the same dtype; mixed dtypes work but lose most of the benefit.
+
+    Attributes
+    ----------
+    cW_ : list, shape (len(M)+1)
+        List of weight caches. Same shapes as MLP's matrices in W. Views into
+        one contiguous buffer.
+    cb_ : list, shape (len(M)+1)
+        List of bias caches. Same shapes as MLP's bias vectors. Views into one
+        contiguous buffer.
     """
 
-    def __init__(self, D, K, hidden_layer_sizes, lr, epsilon=1e-8):
-        self.lr = lr
-        self.epsilon = epsilon
-        self.cW_ = [None for i in range(len(hidden_layer_sizes)+1)]
-        self.cb_ = [None for i in range(len(hidden_layer_sizes)+1)]
+    def __init__(self, D, K, hidden_layer_sizes, lr, epsilon=1e-8,
+                 dtype=np.float32):
+        dtype = np.dtype(dtype)
+        self.dtype = dtype
+        # Keep scalars in dtype so they don't upcast the updates
+        self.lr = dtype.type(lr)
+        self.epsilon = dtype.type(epsilon)
         M = [D] + hidden_layer_sizes + [K]
-        for i in range(len(hidden_layer_sizes)+1):
-            self.cW_[i] = np.zeros((M[i], M[i+1]))
-            self.cb_[i] = np.zeros((M[i+1]))
+        self._cW_flat, self.cW_, self._cb_flat, self.cb_ = _layer_buffers(
+            M, dtype)
+        # Buffers for the updates returned by layer_update(), reused on
+        # every step.
+        _, self._w_updates, _, self._b_updates = _layer_buffers(M, dtype)
 
     def layer_update(self, mlp, i, dJdW_i, dJdb_i, grad_max):
         """Returns weight+bias updates for a single layer, i.
@@ -177,17 +340,36 @@ class AdaGradOptimizer(Optimizer):
         """
         lr = self.lr
         epsilon = self.epsilon
+        w_update = self._w_updates[i]
+        b_update = self._b_updates[i]
+
+        if _adagrad_update is not None:
+            # Caches are contiguous, so reshape(-1) returns views.
+            _grad_max = _adagrad_update(
+                self.cW_[i].reshape(-1), dJdW_i.reshape(-1),
+                w_update.reshape(-1), lr, epsilon)
+            _adagrad_update(self.cb_[i], dJdb_i, b_update, lr, epsilon)
+            return w_update, b_update, max(grad_max, _grad_max)
 
         # Compute max gradient update (for debugging)
-        grad_max = max((grad_max, max(dJdW_i.max(), dJdW_i.min(),
-                                      key=abs)))
+        grad_max = max(grad_max, np.abs(dJdW_i).max())
 
-        # Update caches
-        self.cW_[i] = self.cW_[i] + dJdW_i**2
-        self.cb_[i] = self.cb_[i] + dJdb_i**2
+        # Update caches in place, using the update buffers as scratch space
+        cW = self.cW_[i]
+        cb = self.cb_[i]
+        np.square(dJdW_i, out=w_update)
+        np.square(dJdb_i, out=b_update)
+        cW += w_update
+        cb += b_update
 
         # Compute weight/biase updates using cache, eta, epsilon
-        w_update = lr*(dJdW_i/np.sqrt(self.cW_[i] + epsilon))
-        b_update = lr*(dJdb_i/np.sqrt(self.cb_[i] + epsilon))
+        np.add(cW, epsilon, out=w_update)
+        np.add(cb, epsilon, out=b_update)
+        np.sqrt(w_update, out=w_update)
+        np.sqrt(b_update, out=b_update)
+        np.divide(dJdW_i, w_update, out=w_update)
+        np.divide(dJdb_i, b_update, out=b_update)
+        w_update *= lr
+        b_update *= lr
 
         return w_update, b_update, grad_max
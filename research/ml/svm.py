@@ -7,7 +7,7 @@ from sklearn.utils.multiclass import unique_labels
 from sklearn.utils.validation import check_X_y, check_array, check_is_fitted
 from tabulate import tabulate
 
-from research.ml.kernel import KERNEL_MAP
+from research.ml.kernel import KERNEL_MAP, GaussianKernel, LinearKernel
 
 
 class SVM(BaseEstimator, ClassifierMixin):
@@ -34,6 +34,11 @@ class SVM(BaseEstimator, ClassifierMixin):
         alpha values of support vectors.
     offset_ : float
         Offset (theta) used in discriminant.
+    w_ : np.array or None
+        Primal weight vector sum_i(ai*yi*phi(xi)), where phi maps inputs to
+        the kernel's feature space. Shape (m) for the linear kernel and
+        (n_components) for a GaussianKernel with n_components. None for other
+        kernels.
 
     Examples
     --------
@@ -92,38 +97,58 @@ class SVM(BaseEstimator, ClassifierMixin):
         y : np.array, shape (n)
             Targets
         vectorized : bool, default None
-            Whether to use the vectorized/non-vectorized loss function. If
-            using nonlinear kernel, then this must be false (until I fix it).
-            If None, then vectorized will default to True if kernel is linear,
-            and False if kernel is nonlinear.
+            Deprecated and ignored. The loss is vectorized for every kernel.
 
         Returns
         -------
+        SVM
+            self.
         """
-        # My Input validation
-        if self.kernel.name != 'linear' and vectorized:
-            msg = 'Vectorized loss only works with linear kernel right now.'
-            raise ValueError(msg)
-
-        if vectorized is None:
-            if self.kernel.name == 'linear':
-                vectorized = True
-            else:
-                vectorized = False
-
         # Sklearn input validation
         X, y = check_X_y(X, y)  # Check that X and y have correct shape
         self.classes_ = unique_labels(y)  # Store the classes seen during fit
 
-        if vectorized:
-            loss = self._vectorized_loss
-        else:
-            loss = self._loss
+        # SVM needs 1s and -1s. Don't modify the caller's array.
+        y = np.where(y == 0, -1, y)
+
+        return self._fit_fast(X, y)
+
+    def _fit_fast(self, X, y):
+        """Fits SVM classifier without validating inputs.
+
+        Skips sklearn's input checks, so callers that fit repeatedly on
+        already-validated data (e.g. cross-validation or hyperparameter
+        sweeps) only pay for them once. Does not set classes_.
+
+        Parameters
+        ----------
+        X : np.ndarray, shape (-1, n)
+            Input. Must be a 2D float array.
+        y : np.array, shape (n)
+            Targets. Must contain only 1s and -1s.
 
-        # SVM needs 1s and -1s
-        y[y == 0] = -1
+        Returns
+        -------
+        SVM
+            self.
+        """
+        # Random Fourier features are drawn lazily, so clear any drawn by a
+        # previous fit. The new draw is then kept for predicting.
+        if isinstance(self.kernel, GaussianKernel):
+            self.kernel.W_ = None
+            self.kernel.b_ = None
+
+        # X and y are fixed during optimization, so compute
+        # H[i, j] = yi*yj*K(xi, xj) once instead of on every loss evaluation.
+        if isinstance(self.kernel, LinearKernel):
+            # yi*yj*<xi, xj> = <yi*xi, yj*xj>
+            yX = y.reshape(-1, 1) * X
+            H = self.kernel.gram(yX, yX)
+        else:
+            H = y.reshape(-1, 1) * y * self.kernel.gram(X, X)
 
-        initial_alphas = np.random.rand(len(X))
+        # Deterministic, uniform starting point
+        initial_alphas = np.full(len(X), 1 / len(X))
 
         # Define constraints
         #
@@ -140,21 +165,31 @@ class SVM(BaseEstimator, ClassifierMixin):
         #         lb = 0
         #         ub = 0
         #     Constraint 2:
-        #         A = 1
+        #         Expressed as bounds instead, which SLSQP enforces directly
+        #         rather than evaluating an inequality constraint.
         #         lb = 0
         #         ub = np.inf
         #
         con1 = optimize.LinearConstraint(y, 0, 0)
-        con2 = {'type': 'ineq', 'fun': lambda a: a}
-        self.opt_result_ = optimize.minimize(loss, initial_alphas,
-                                             constraints=(con1, con2),
-                                             args=(X, y))
+        bounds = optimize.Bounds(0, np.inf)
+        self.opt_result_ = optimize.minimize(self._loss, initial_alphas,
+                                             jac=self._loss_jac,
+                                             method='SLSQP', bounds=bounds,
+                                             constraints=(con1,), args=(H,))
         # Find indices of support vectors
         sv_idx = np.where(self.opt_result_.x > 0.001)
         self.sup_X_ = X[sv_idx]
         self.sup_y_ = y[sv_idx]
         self.sup_alphas_ = self.opt_result_.x[sv_idx]
 
+        # If the kernel has an explicit feature space, the discriminant is a
+        # dot product there, so collapse the support vectors into one vector.
+        sup_Phi = self._primal_features(self.sup_X_)
+        if sup_Phi is not None:
+            self.w_ = (self.sup_alphas_ * self.sup_y_).dot(sup_Phi)
+        else:
+            self.w_ = None
+
         self.offset_ = self._compute_offset()
 
         return self
@@ -197,14 +232,8 @@ class SVM(BaseEstimator, ClassifierMixin):
         None
         """
         # Compute decision boundary
-        y[y == 0] = -1
-        _X = np.random.rand(75_000, self.sup_X_.shape[1])
-        g = self._compute_discriminant(_X)
-        TOL = .03
-        H = _X[np.where(np.abs(g) < TOL)]
-        Hpos = _X[np.where((np.abs(g) < 1 + TOL) & (np.abs(g) > 1 - TOL))]
-        Hneg = _X[np.where((np.abs(g) > -(1 + TOL))
-                           & (np.abs(g) < (-1 + TOL)))]
+        y = np.where(y == 0, -1, y)
+        _X, g, H, Hpos, Hneg = self._sample_boundaries()
         # Plot
         fig, ax = plt.subplots(1, 1, figsize=(10, 7))
         C1 = X[np.where(y == 1)]
@@ -237,14 +266,8 @@ class SVM(BaseEstimator, ClassifierMixin):
         -------
         None
         """
-        y[y == 0] = -1
-        _X = np.random.rand(75_000, self.sup_X_.shape[1])
-        g = self._compute_discriminant(_X)
-        TOL = .03
-        H = _X[np.where(np.abs(g) < TOL)]
-        Hpos = _X[np.where((np.abs(g) < 1 + TOL) & (np.abs(g) > 1 - TOL))]
-        Hneg = _X[np.where((np.abs(g) > -(1 + TOL))
-                           & (np.abs(g) < (-1 + TOL)))]
+        y = np.where(y == 0, -1, y)
+        _X, g, H, Hpos, Hneg = self._sample_boundaries()
         # Plot
         fig, (ax0, ax1) = plt.subplots(2, 1, figsize=(10, 15))
 
@@ -271,16 +294,49 @@ class SVM(BaseEstimator, ClassifierMixin):
         ax1.set_ylim([-.1, 1.2])
         return None
 
-    def _loss(self, alphas, _X, y, verbose=False):
+    def _sample_boundaries(self, n_samples=75_000, tol=.03):
+        """Samples points on or near H, H+, and H- for plotting.
+
+        Parameters
+        ----------
+        n_samples : int, default 75_000
+            Number of random points to sample over [0, 1]^m.
+        tol : float, default .03
+            Maximum distance of g(x) from 0, 1, or -1 for a point to be
+            considered on H, H+, or H-.
+
+        Returns
+        -------
+        tuple
+            np.ndarray, shape (n_samples, m)
+                Sampled points.
+            np.array, shape (n_samples)
+                Discriminant values of sampled points.
+            np.ndarray
+                Points on H, where g(x) = 0.
+            np.ndarray
+                Points on H+, where g(x) = 1.
+            np.ndarray
+                Points on H-, where g(x) = -1.
+        """
+        _X = np.random.rand(n_samples, self.sup_X_.shape[1])
+        g = self._compute_discriminant(_X)
+        abs_g = np.abs(g)
+        on_margin = np.abs(abs_g - 1) < tol
+        H = _X[abs_g < tol]
+        Hpos = _X[on_margin & (g > 0)]
+        Hneg = _X[on_margin & (g < 0)]
+        return _X, g, H, Hpos, Hneg
+
+    def _loss(self, alphas, H, verbose=False):
         """Dual optimization loss function.
 
         Parameters
         ----------
-        _X : np.ndarray, shape (n, m)
-            Inputs. Underscore required because scipy.optimize.minimize()'s
-            first parameter is actually `X`.
-        y : np.array, shape (n)
-            Targets.
+        alphas : np.array, shape (n)
+            Lagrange multipliers.
+        H : np.ndarray, shape (n, n)
+            Kernel matrix scaled by targets, where H[i, j] = yi*yj*K(xi, xj).
         verbose: bool, default False
             If True, print debugging info
 
@@ -289,94 +345,55 @@ class SVM(BaseEstimator, ClassifierMixin):
         float
             Total loss.
         """
-        X = _X
         left_sum = alphas.sum()
-        right_sum = 0
-
-        terms = []
-
-        for i, xi in enumerate(X):
-            ai = alphas[i]
-            yi = y[i]
-            for j, xj in enumerate(X):
-                aj = alphas[j]
-                yj = y[j]
-                term = ai*aj*yi*yj*self.kernel.transform(xi, xj)
-                if term != 0:
-                    terms.append([xi, xj, ai, aj, yi, yj,
-                                  self.kernel.transform(xi, xj),
-                                  term])
-                right_sum += term
+        # right term is sum_ij(ai*aj*yi*yj*K(xi, xj)) = a.T*H*a
+        right_sum = alphas.dot(H).dot(alphas)
 
         if verbose:
-            print(tabulate(terms, headers=['xi', 'xj', 'ai', 'aj', 'yi', 'yj',
-                                           'kernel(xi, xj)', 'rhs_sum']))
-            print('\nleft_sum: {:.3f}'.format(left_sum))
-            print('right_sum: {:.3f}'.format(right_sum))
+            print(tabulate([[left_sum, right_sum]],
+                           headers=['left_sum', 'right_sum']))
 
         total_loss = left_sum - .5*right_sum
 
         # Use -1 since we need to minimize
         return -1 * total_loss
 
-    def _vectorized_loss(self, alphas, _X, y, verbose=False):
-        """Vectorized implementation of dual optimization loss function.
+    def _loss_jac(self, alphas, H):
+        """Gradient of the dual optimization loss function.
 
         Parameters
         ----------
-        _X : np.ndarray, shape (n, m)
-            Inputs. Underscore required because scipy.optimize.minimize()'s
-            first parameter is actually `X`.
-        y : np.array, shape (n)
-            Targets.
-        verbose: bool, default False
-            If True, print debugging info
+        alphas : np.array, shape (n)
+            Lagrange multipliers.
+        H : np.ndarray, shape (n, n)
+            Kernel matrix scaled by targets, where H[i, j] = yi*yj*K(xi, xj).
 
         Returns
         -------
-        float
-            Total loss.
+        np.array, shape (n)
+            Gradient of the loss with respect to alphas.
         """
-        X = _X
-        left_sum = alphas.sum()
-        # make right term -.5*a.T*H*a
-        # Where H = yi*yj*xi.dot(xj.T)
-        # X_ = y*X
-        y_ = y.reshape(-1, 1)
-        # y shape(n, 1)
-        # X shape (n, 2)
-        X_ = y_ * X
-        # X_ shape (n, 2)
-        # H is (n, n)
-        H = self.kernel.transform(X_, X_.T)
-        # a shape (n,)
-        # a.T shape (n,)
-        right_sum = alphas.T.dot(H).dot(alphas)
-        total_loss = left_sum - .5*right_sum
-
-        if verbose:
-            print(tabulate([[left_sum, right_sum]],
-                           headers=['left_sum', 'right_sum']))
-
-        return -1 * total_loss
+        # Use -1 since we need to minimize
+        return -1 * (np.ones_like(alphas) - H.dot(alphas))
 
     def _compute_offset(self):
-        """Compute offset (theta) from a support vector.
+        """Compute offset (theta) averaged over all support vectors.
+
+        Any single support vector xk gives theta = yk - sum_i(ai*yi*K(xi, xk)),
+        but averaging over all of them is less sensitive to numerical error.
 
         Returns
         -------
         float
             Offset (theta).
         """
-        # Uses first support vector, although any can be used.
-        xk = self.sup_X_[0]
-        yk = self.sup_y_[0]
-
-        _sum = 0
-        for xi, yi, ai in zip(self.sup_X_, self.sup_y_, self.sup_alphas_):
-            _sum += ai * yi * self.kernel.transform(xi, xk)
+        if self.w_ is not None:
+            decision = self._primal_features(self.sup_X_).dot(self.w_)
+        else:
+            K = self.kernel.gram(self.sup_X_, self.sup_X_)
+            decision = (self.sup_alphas_ * self.sup_y_).dot(K)
 
-        offset = yk - _sum
+        offset = float((self.sup_y_ - decision).mean())
         return offset
 
     def _compute_discriminant(self, X):
@@ -392,12 +409,35 @@ class SVM(BaseEstimator, ClassifierMixin):
         np.array<float>, shape (X.shape[0])
             Values computed by discriminant g(x).
         """
-        g = np.zeros(X.shape[0])
+        if self.w_ is not None:
+            return self._primal_features(X).dot(self.w_) + self.offset_
 
-        for i, x in enumerate(X):
-            _sum = 0
-            for xi, yi, ai in zip(self.sup_X_, self.sup_y_, self.sup_alphas_):
-                _sum += ai * yi * self.kernel.transform(xi, x)
-            g[i] = _sum + self.offset_
+        # K shape (n_support_vectors, len(X))
+        K = self.kernel.gram(self.sup_X_, X)
+        g = (self.sup_alphas_ * self.sup_y_).dot(K) + self.offset_
 
         return g
+
+    def _primal_features(self, X):
+        """Maps inputs to the kernel's explicit feature space, if it has one.
+
+        The linear kernel's features are the inputs themselves. A
+        GaussianKernel with n_components uses random Fourier features.
+
+        Parameters
+        ----------
+        X : np.ndarray, shape (-1, m)
+            Input.
+
+        Returns
+        -------
+        np.ndarray or None
+            Features phi(X) such that K(xi, xj) = phi(xi).dot(phi(xj)), or None
+            if the kernel has no explicit feature space.
+        """
+        if isinstance(self.kernel, LinearKernel):
+            return X
+        if (isinstance(self.kernel, GaussianKernel)
+                and self.kernel.n_components is not None):
+            return self.kernel.feature_map(X)
+        return None